@@ -10,11 +10,17 @@ class CaptionEnhancer:
     to make them more specific and useful for identifying plant diseases.
     """
 
-    def __init__(self, llm=None):
+    def __init__(self, llm=None, gateway=None):
         # Use provided LLM instance or initialize a default ChatOllama model
         # (e.g., Mistral)
         self.llm = llm or ChatOllama(
-            model="mistral", base_url="http://host.docker.internal:11434"
+            model="mistral",
+            base_url="http://host.docker.internal:11434",
+            # With a gateway, bound each HTTP request by its deadline so
+            # a hung Ollama releases the gateway slot
+            client_kwargs=(
+                {"timeout": gateway.call_timeout} if gateway else {}
+            ),
         )
 
         # Define a prompt template that instructs the LLM
@@ -31,6 +37,9 @@ class CaptionEnhancer:
             self.prompt | self.llm | RunnableLambda(lambda x: x.content)
         )
 
+        # Optional LLMGateway; without one the LLM is called directly
+        self.gateway = gateway
+
     def enhance(self, caption: str) -> str:
         """
         Enhances the input caption using the LLM chain.
@@ -40,6 +49,13 @@ class CaptionEnhancer:
             or another model.
 
         Returns:
-            str: A refined, domain-aware caption.
+            str: A refined, domain-aware caption, or the original caption
+            if the gateway skips the LLM call.
         """
-        return self.chain.invoke({"caption": caption})
+        if self.gateway is None:
+            return self.chain.invoke({"caption": caption})
+        return self.gateway.call(
+            "enhance",
+            lambda: self.chain.invoke({"caption": caption}),
+            fallback=caption,
+        )
@@ -0,0 +1,126 @@
+from collections import Counter
+
+from lexical_index import tokenize, crop_of
+
+# Share of the probe hits one crop needs before an image is routed to it
+IMAGE_ROUTE_MIN_SHARE = 0.6
+
+
+class CropRouter:
+    """
+    Infers which crops a query is about, so searches can be restricted to
+    that partition of the catalogue instead of every indexed crop.
+
+    Built once per loaded lexical index (see `resources.py`), not per query.
+    """
+
+    def __init__(self, labels):
+        self.labels_by_crop = {}
+        for label in labels:
+            crop = crop_of(label)
+            if crop:
+                self.labels_by_crop.setdefault(crop, set()).add(label)
+
+    def route(self, *texts) -> set:
+        """
+        Find the crops named in any of the given texts (raw or rephrased
+        query, image caption).
+
+        Args:
+            *texts (str): Texts to inspect; None values are ignored.
+
+        Returns:
+            set: Matched crops, or an empty set when no crop is named or
+            only one crop is indexed (nothing to filter out).
+        """
+        if not self.multi_crop:
+            return set()
+        terms = set()
+        for text in texts:
+            terms.update(tokenize(text))
+        return {crop for crop in self.labels_by_crop if crop in terms}
+
+    @property
+    def multi_crop(self) -> bool:
+        """
+        True when more than one crop is indexed, i.e. routing can help.
+        """
+        return len(self.labels_by_crop) > 1
+
+    def route_hits(self, metadatas, min_share=IMAGE_ROUTE_MIN_SHARE) -> set:
+        """
+        Infer the crop of an image query from the labels of its nearest
+        neighbours (the hits of its own unfiltered vector query).
+
+        Args:
+            metadatas (list): Metadatas of the query's hits.
+            min_share (float): Fraction of hits the majority crop needs.
+
+        Returns:
+            set: The majority crop, or an empty set if no crop dominates.
+        """
+        if not self.multi_crop or not metadatas:
+            return set()
+        crops = Counter(crop_of(m.get("label")) for m in metadatas)
+        crop, hits = crops.most_common(1)[0]
+        if crop in self.labels_by_crop and hits / len(metadatas) >= min_share:
+            return {crop}
+        return set()
+
+    def labels_for(self, crops) -> list:
+        """
+        List the labels belonging to the given crops.
+        """
+        return sorted(
+            label for crop in crops for label in self.labels_by_crop[crop]
+        )
+
+
+def keep_crops(results, crops):
+    """
+    Drop rows of other crops from a `collection.query` result.
+
+    Args:
+        results (dict): Result with `ids`, `metadatas` and `distances`.
+        crops (set): Crops to keep.
+
+    Returns:
+        dict: A result of the same shape with only the kept rows.
+    """
+    rows = [
+        row
+        for row in zip(
+            results["ids"][0],
+            results["metadatas"][0],
+            results["distances"][0],
+        )
+        if crop_of(row[1].get("label")) in crops
+    ]
+    return {
+        "ids": [[row[0] for row in rows]],
+        "metadatas": [[row[1] for row in rows]],
+        "distances": [[row[2] for row in rows]],
+    }
+
+
+def build_where(labels=None, types=None):
+    """
+    Build a ChromaDB `where` filter restricting results by label and/or
+    row type.
+
+    Args:
+        labels (list or None): Allowed labels.
+        types (list or None): Allowed row types (image, caption, label,
+        sentence).
+
+    Returns:
+        dict or None: The filter, or None to search the whole collection.
+    """
+    clauses = []
+    if labels:
+        clauses.append({"label": {"$in": list(labels)}})
+    if types:
+        clauses.append({"type": {"$in": list(types)}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
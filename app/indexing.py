@@ -6,6 +6,7 @@ import hashlib
 from chromadb import HttpClient
 from utils import get_image_embedding, generate_caption, get_text_embedding
 from caption_enhancer import CaptionEnhancer
+from lexical_index import BM25Index, document_text
 
 # --- Setup Logging ---
 logging.basicConfig(level=logging.INFO)
@@ -22,6 +23,9 @@ logger.info(f"✅ Chroma collection count: {collection.count()}")
 # --- Caption enhancer ---
 caption_enhancer = CaptionEnhancer()
 
+# --- Lexical (BM25) index over captions and labels ---
+lexical_index = BM25Index.load_or_rebuild(collection)
+
 
 # --- Dataset path ---
 DATA_DIR = "data/pest_disease"
@@ -40,6 +44,13 @@ def normalize_label(path: str) -> str:
 def index_images():
     logger.info(f"📂 Indexing images from: {DATA_DIR}")
 
+    try:
+        _index_directory()
+    finally:
+        lexical_index.save()
+
+
+def _index_directory():
     for root, _, files in os.walk(DATA_DIR):
         for file in tqdm(files, desc="Indexing images"):
             if not file.lower().endswith((".jpg", ".jpeg", ".png")):
@@ -144,6 +155,19 @@ def index_images():
                     ],
                 )
 
+                # Add caption + label to the lexical index
+                lexical_index.add(
+                    shared_id,
+                    document_text(caption, label),
+                    {
+                        "group_id": shared_id,
+                        "type": "caption",
+                        "label": label,
+                        "path": file_path,
+                        "caption": caption,
+                    },
+                )
+
                 logger.info(f"✅ Indexed: {file_path} [label: {label}]")
                 logger.info(
                     f"📦 Final collection size: {collection.count()} items."
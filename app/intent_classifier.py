@@ -11,9 +11,13 @@ INTENT_FALLBACK_QUERIES = {
 
 
 class IntentClassifier:
-    def __init__(self, llm=None):
+    def __init__(self, llm=None, gateway=None):
         self.llm = llm or ChatOllama(
-            model="mistral", base_url="http://host.docker.internal:11434"
+            model="mistral",
+            base_url="http://host.docker.internal:11434",
+            client_kwargs=(
+                {"timeout": gateway.call_timeout} if gateway else {}
+            ),
         )
         self.prompt = PromptTemplate.from_template(
             """
@@ -28,7 +32,17 @@ class IntentClassifier:
             Category:
             """
         )
+        # Optional LLMGateway; without one the LLM is called directly
+        self.gateway = gateway
 
-    def classify(self, query: str) -> str:
+    def classify(self, query: str) -> str | None:
+        """
+        Classify the query intent. Returns None if the gateway skips the
+        LLM call, so callers fall through to a plain search.
+        """
         chain = self.prompt | self.llm | (lambda x: x.content.strip().lower())
-        return chain.invoke({"query": query})
+        if self.gateway is None:
+            return chain.invoke({"query": query})
+        return self.gateway.call(
+            "intent", lambda: chain.invoke({"query": query}), fallback=None
+        )
@@ -0,0 +1,382 @@
+import os
+import re
+import json
+import math
+import logging
+from collections import Counter, defaultdict
+
+# --- Setup Logging ---
+logger = logging.getLogger(__name__)
+
+# --- Index location (shared by indexing.py and main.py) ---
+LEXICAL_INDEX_PATH = "app/index/bm25_index.json"
+
+# Words that carry no signal for disease lookups, including generic
+# domain words the rephraser and caption enhancer put in almost every text
+STOPWORDS = set(
+    "a an and are as at be by for from in is it me of on or show shows "
+    "that the this to with example examples image images photo picture "
+    "plant plants crop crops leaf leaves disease diseases symptom "
+    "symptoms sign signs infected infection affected showing".split()
+)
+
+
+def tokenize(text: str) -> list:
+    """
+    Split text into lowercase alphanumeric terms, dropping stopwords.
+
+    Args:
+        text (str): Caption, label or query text.
+
+    Returns:
+        list: Terms in their original order.
+    """
+    terms = re.findall(r"[a-z0-9]+", (text or "").lower())
+    return [t for t in terms if t not in STOPWORDS]
+
+
+def crop_of(label: str) -> str | None:
+    """
+    Extract the crop from a label produced by `normalize_label`.
+
+    Dataset folders are named "<crop> <condition>" (e.g. "cashew leaf
+    miner"), so the crop is the first word of the label.
+    """
+    return label.split()[0] if label else None
+
+
+class BM25Index:
+    """
+    An in-process inverted index scoring documents with Okapi BM25.
+
+    Each document is one indexed image (keyed by its `group_id`), built
+    from the LLM-enhanced caption and the folder label. Documents can be
+    added or replaced one at a time, so the index is kept up to date
+    while `indexing.py` walks the dataset.
+
+    Postings are partitioned by crop, so a search restricted to some
+    crops only touches those crops' postings.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        # crop -> term -> {doc_id: term frequency}
+        self.postings = defaultdict(lambda: defaultdict(dict))
+        # crop -> [number of documents, total document length]
+        self.partition_stats = defaultdict(lambda: [0, 0])
+        self.doc_lengths = {}
+        self.documents = {}
+        # label -> number of documents, kept in step with add/remove
+        self.label_counts = Counter()
+        # label -> distinctive terms, rebuilt only when the label set changes
+        self._distinctive_terms = None
+
+    def __len__(self):
+        return len(self.documents)
+
+    def add(self, doc_id: str, text: str, metadata: dict = None):
+        """
+        Add a document, replacing any previous version with the same id.
+
+        Args:
+            doc_id (str): Unique id (the image `group_id`).
+            text (str): Text to index (caption + label).
+            metadata (dict): Metadata returned alongside search hits.
+        """
+        if doc_id in self.documents:
+            self.remove(doc_id)
+
+        label = (metadata or {}).get("label")
+        crop = crop_of(label)
+        terms = tokenize(text)
+        for term, tf in Counter(terms).items():
+            self.postings[crop][term][doc_id] = tf
+        self.doc_lengths[doc_id] = len(terms)
+        self.partition_stats[crop][0] += 1
+        self.partition_stats[crop][1] += len(terms)
+        self.documents[doc_id] = {"text": text, "metadata": metadata or {}}
+
+        if label:
+            if not self.label_counts[label]:
+                self._distinctive_terms = None
+            self.label_counts[label] += 1
+
+    def remove(self, doc_id: str):
+        """
+        Remove a document from the index if present.
+
+        Args:
+            doc_id (str): Id of the document to remove.
+        """
+        doc = self.documents.pop(doc_id, None)
+        if doc is None:
+            return
+        label = doc["metadata"].get("label")
+        crop = crop_of(label)
+        postings = self.postings[crop]
+        for term in set(tokenize(doc["text"])):
+            postings[term].pop(doc_id, None)
+            if not postings[term]:
+                del postings[term]
+        stats = self.partition_stats[crop]
+        stats[0] -= 1
+        stats[1] -= self.doc_lengths.pop(doc_id, 0)
+        if not stats[0]:
+            self.postings.pop(crop, None)
+            del self.partition_stats[crop]
+
+        if label:
+            self.label_counts[label] -= 1
+            if self.label_counts[label] <= 0:
+                del self.label_counts[label]
+                self._distinctive_terms = None
+
+    def labels(self) -> set:
+        """
+        Return the distinct labels of the indexed documents.
+        """
+        return set(self.label_counts)
+
+    def search(
+        self,
+        query: str,
+        n_results: int = 10,
+        crops=None,
+        require_label_term: bool = True,
+    ) -> list:
+        """
+        Score documents against the query with BM25.
+
+        Args:
+            query (str): Free-text query.
+            n_results (int): Maximum number of hits to return.
+            crops (set or None): Only search these crops' partitions; the
+            corpus statistics are taken over those partitions too.
+            require_label_term (bool): Only return documents matching at
+            least one distinctive label term of the query (e.g.
+            "anthracnose"), so caption words alone never admit a hit.
+
+        Returns:
+            list: `(doc_id, score, metadata)` tuples, best first.
+        """
+        if crops:
+            partitions = [c for c in crops if c in self.partition_stats]
+        else:
+            partitions = list(self.partition_stats)
+        n_docs = sum(self.partition_stats[c][0] for c in partitions)
+        if not n_docs:
+            return []
+        avg_length = (
+            sum(self.partition_stats[c][1] for c in partitions) / n_docs
+        )
+
+        query_terms = set(tokenize(query))
+        if require_label_term:
+            key_terms = query_terms & self._label_vocabulary()
+            if not key_terms:
+                return []
+
+        scores = defaultdict(float)
+        admitted = set()
+        for term in query_terms:
+            term_postings = [
+                self.postings[c][term]
+                for c in partitions
+                if term in self.postings[c]
+            ]
+            df = sum(len(postings) for postings in term_postings)
+            if not df:
+                continue
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            for postings in term_postings:
+                for doc_id, tf in postings.items():
+                    length_ratio = self.doc_lengths[doc_id] / avg_length
+                    norm = self.k1 * (1 - self.b + self.b * length_ratio)
+                    scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+                    if not require_label_term or term in key_terms:
+                        admitted.add(doc_id)
+
+        ranked = sorted(
+            ((d, s) for d, s in scores.items() if d in admitted),
+            key=lambda x: x[1],
+            reverse=True,
+        )
+        return [
+            (doc_id, score, self.documents[doc_id]["metadata"])
+            for doc_id, score in ranked[:n_results]
+        ]
+
+    def match_label(self, query: str):
+        """
+        Find an indexed label named explicitly in the query.
+
+        A label matches when every one of its distinctive terms (terms not
+        shared by all labels, e.g. the crop name in a single-crop dataset)
+        appears in the query. Such queries are precise enough to be
+        searched as-is, without an LLM rephrase.
+
+        Args:
+            query (str): Free-text query.
+
+        Returns:
+            str or None: The matched label, preferring the most specific.
+        """
+        if self._distinctive_terms is None:
+            self._distinctive_terms = self._build_distinctive_terms()
+        query_terms = set(tokenize(query))
+
+        best = None
+        for label, distinctive in self._distinctive_terms.items():
+            if distinctive and distinctive <= query_terms:
+                if best is None or len(distinctive) > len(
+                    self._distinctive_terms[best]
+                ):
+                    best = label
+        return best
+
+    def _label_vocabulary(self) -> set:
+        if self._distinctive_terms is None:
+            self._distinctive_terms = self._build_distinctive_terms()
+        return set().union(*self._distinctive_terms.values())
+
+    def _build_distinctive_terms(self) -> dict:
+        label_terms = {label: set(tokenize(label)) for label in self.labels()}
+        term_counts = Counter(
+            t for terms in label_terms.values() for t in terms
+        )
+        return {
+            label: {t for t in terms if term_counts[t] < len(label_terms)}
+            for label, terms in label_terms.items()
+        }
+
+    def save(self, path: str = LEXICAL_INDEX_PATH):
+        """
+        Persist the indexed documents as JSON; postings are rebuilt on load.
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {"k1": self.k1, "b": self.b, "documents": self.documents}, f
+            )
+        os.replace(tmp_path, path)
+        logger.info(f"💾 Saved lexical index ({len(self)} docs) to {path}")
+
+    @classmethod
+    def load(cls, path: str = LEXICAL_INDEX_PATH):
+        """
+        Load an index saved with `save`. Returns an empty index if the
+        file does not exist.
+        """
+        if not os.path.exists(path):
+            return cls()
+        with open(path) as f:
+            data = json.load(f)
+        index = cls(k1=data.get("k1", 1.5), b=data.get("b", 0.75))
+        for doc_id, doc in data.get("documents", {}).items():
+            index.add(doc_id, doc["text"], doc["metadata"])
+        logger.info(f"📚 Loaded lexical index ({len(index)} docs) from {path}")
+        return index
+
+    @classmethod
+    def load_or_rebuild(cls, collection, path: str = LEXICAL_INDEX_PATH):
+        """
+        Load the saved index, rebuilding it from ChromaDB (and saving it)
+        when the file is missing, empty or unreadable.
+        """
+        try:
+            index = cls.load(path)
+        except (ValueError, KeyError) as e:
+            logger.warning(f"⚠️ Lexical index unreadable, rebuilding: {e}")
+            index = cls()
+        if not len(index):
+            index = cls.from_collection(collection)
+            index.save(path)
+        return index
+
+    @classmethod
+    def from_collection(cls, collection):
+        """
+        Build an index from the caption rows already stored in ChromaDB,
+        for collections indexed before the lexical index existed.
+        """
+        index = cls()
+        rows = collection.get(
+            where={"type": "caption"}, include=["metadatas"]
+        )
+        for metadata in rows["metadatas"]:
+            index.add(
+                metadata["group_id"],
+                document_text(metadata.get("caption"), metadata.get("label")),
+                metadata,
+            )
+        logger.info(f"📚 Built lexical index ({len(index)} docs) from Chroma")
+        return index
+
+
+def document_text(caption: str, label: str) -> str:
+    """
+    Text indexed for one image: the enhanced caption followed by its label.
+    """
+    return f"{caption or ''} {label or ''}".strip()
+
+
+def reciprocal_rank_fusion(
+    vector_results, lexical_hits, n_results: int = 10, k: int = 60
+):
+    """
+    Fuse ChromaDB vector results with BM25 hits using reciprocal rank
+    fusion (RRF): score = sum of 1 / (k + rank) over both rankings.
+
+    Vector rows are ranked per image (`group_id`), since one image is
+    stored as several rows (image, caption, label, sentence).
+
+    Args:
+        vector_results (dict): Result of `collection.query` with
+        `metadatas` and `distances` included.
+        lexical_hits (list): Output of `BM25Index.search`.
+        n_results (int): Maximum number of fused results.
+        k (int): RRF damping constant.
+
+    Returns:
+        dict: Results in the same shape as `collection.query`. Images only
+        found lexically have a distance of None.
+    """
+    entries = {}
+    rank = 0
+    for row_id, metadata, distance in zip(
+        vector_results["ids"][0],
+        vector_results["metadatas"][0],
+        vector_results["distances"][0],
+    ):
+        group_id = metadata.get("group_id", row_id)
+        if group_id in entries:
+            continue
+        rank += 1
+        entries[group_id] = {
+            "id": row_id,
+            "metadata": metadata,
+            "distance": distance,
+            "score": 1 / (k + rank),
+        }
+
+    for rank, (group_id, _, metadata) in enumerate(lexical_hits, start=1):
+        entry = entries.setdefault(
+            group_id,
+            {
+                "id": group_id,
+                "metadata": metadata,
+                "distance": None,
+                "score": 0,
+            },
+        )
+        entry["score"] += 1 / (k + rank)
+
+    fused = sorted(entries.values(), key=lambda e: e["score"], reverse=True)
+    fused = fused[:n_results]
+    return {
+        "ids": [[e["id"] for e in fused]],
+        "metadatas": [[e["metadata"] for e in fused]],
+        "distances": [[e["distance"] for e in fused]],
+    }
@@ -0,0 +1,195 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+# --- Setup Logging ---
+logger = logging.getLogger(__name__)
+
+# --- Gateway defaults ---
+MAX_CONCURRENT_CALLS = 2  # Ollama calls in flight across all sessions
+QUEUE_TIMEOUT = 0.5  # seconds to wait for a free slot before shedding
+CALL_TIMEOUT = 8.0  # per-call deadline in seconds
+FAILURE_THRESHOLD = 3  # consecutive failures before the circuit opens
+RESET_TIMEOUT = 30.0  # seconds the circuit stays open before a probe
+LATENCY_BUDGET = 5.0  # degrade when the average call is slower than this
+LATENCY_SMOOTHING = 0.3  # weight of the newest sample in the average
+
+
+class LLMGateway:
+    """
+    A shared gateway for every Ollama-dependent stage (rephrase, intent,
+    caption enhancement).
+
+    Calls go through `call`, which returns the stage's fallback instead of
+    raising or blocking when the LLM is overloaded, slow or down:
+    - a bounded semaphore limits concurrent calls; excess calls are shed
+      and count as failures, so stalled calls open the circuit,
+    - each call has a deadline, capped by any active `budget`,
+    - a circuit breaker skips calls after repeated failures,
+    - calls are skipped while the average latency exceeds the budget,
+      with one probe let through every `reset_timeout` seconds.
+    """
+
+    def __init__(
+        self,
+        max_concurrent_calls: int = MAX_CONCURRENT_CALLS,
+        queue_timeout: float = QUEUE_TIMEOUT,
+        call_timeout: float = CALL_TIMEOUT,
+        failure_threshold: int = FAILURE_THRESHOLD,
+        reset_timeout: float = RESET_TIMEOUT,
+        latency_budget: float = LATENCY_BUDGET,
+    ):
+        self.queue_timeout = queue_timeout
+        self.call_timeout = call_timeout
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.latency_budget = latency_budget
+
+        self._slots = threading.BoundedSemaphore(max_concurrent_calls)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrent_calls, thread_name_prefix="llm"
+        )
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._failures = 0
+        self._opened_at = None
+        self._avg_latency = 0.0
+        self._last_probe = 0.0
+        # Start times of the calls holding a slot
+        self._inflight = {}
+
+    @contextmanager
+    def budget(self, seconds: float):
+        """
+        Cap the total time LLM calls made by this thread (one Streamlit
+        session run) may take; calls past the deadline use their fallback.
+        """
+        previous = getattr(self._local, "deadline", None)
+        self._local.deadline = time.monotonic() + seconds
+        try:
+            yield
+        finally:
+            self._local.deadline = previous
+
+    def call(self, name: str, fn, fallback):
+        """
+        Run `fn()` under the gateway's limits.
+
+        Args:
+            name (str): Stage name used in logs (e.g. "rephrase").
+            fn (callable): The LLM call.
+            fallback: Value returned when the call is skipped or fails.
+
+        Returns:
+            The result of `fn()`, or `fallback`.
+        """
+        timeout = self._timeout()
+        if timeout <= 0:
+            logger.warning(f"⏱️ LLM budget spent, skipping {name}.")
+            return fallback
+        if not self._allow():
+            logger.warning(f"⚡ LLM degraded, skipping {name}.")
+            return fallback
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            logger.warning(f"🚦 LLM busy, skipping {name}.")
+            # Every slot is held: as slow as the oldest call in flight
+            self._record(self._oldest_inflight(), success=False)
+            return fallback
+
+        start = time.monotonic()
+        token = object()
+        with self._lock:
+            self._inflight[token] = start
+        try:
+            future = self._executor.submit(self._run, fn, token)
+        except Exception:
+            self._release(token)
+            raise
+
+        try:
+            result = future.result(timeout=timeout)
+        except TimeoutError:
+            # The worker keeps its slot until the client's own request
+            # timeout fires, so a stalled model keeps applying backpressure
+            logger.warning(f"⏱️ LLM {name} timed out after {timeout:.1f}s.")
+            self._record(time.monotonic() - start, success=False)
+            return fallback
+        except Exception as e:
+            logger.warning(f"⚠️ LLM {name} failed: {e}")
+            self._record(time.monotonic() - start, success=False)
+            return fallback
+
+        self._record(time.monotonic() - start, success=True)
+        return result
+
+    def _run(self, fn, token):
+        try:
+            return fn()
+        finally:
+            self._release(token)
+
+    def _release(self, token):
+        with self._lock:
+            self._inflight.pop(token, None)
+        self._slots.release()
+
+    def _oldest_inflight(self) -> float:
+        with self._lock:
+            if not self._inflight:
+                return 0.0
+            return time.monotonic() - min(self._inflight.values())
+
+    def _timeout(self) -> float:
+        deadline = getattr(self._local, "deadline", None)
+        if deadline is None:
+            return self.call_timeout
+        return min(self.call_timeout, deadline - time.monotonic())
+
+    def _allow(self) -> bool:
+        """
+        Decide whether a call may go to the LLM, letting a single probe
+        through once the circuit or degrade period has cooled down.
+        """
+        with self._lock:
+            degraded = (
+                self._opened_at is not None
+                or self._avg_latency > self.latency_budget
+            )
+            if not degraded:
+                return True
+            now = time.monotonic()
+            cooled_from = max(self._opened_at or 0.0, self._last_probe)
+            if now - cooled_from < self.reset_timeout:
+                return False
+            self._last_probe = now
+            return True
+
+    def _record(self, latency: float, success: bool):
+        with self._lock:
+            self._avg_latency = (
+                LATENCY_SMOOTHING * latency
+                + (1 - LATENCY_SMOOTHING) * self._avg_latency
+            )
+            if success:
+                if latency <= self.latency_budget < self._avg_latency:
+                    # A fast probe ends the degrade period straight away
+                    self._avg_latency = latency
+                self._failures = 0
+                if self._opened_at is not None:
+                    logger.info("✅ LLM circuit closed.")
+                self._opened_at = None
+                return
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning(
+                        f"🔌 LLM circuit opened after "
+                        f"{self._failures} failures."
+                    )
+                self._opened_at = time.monotonic()
+
+
+# Shared by every Streamlit session in this process
+llm_gateway = LLMGateway()
@@ -1,12 +1,21 @@
 import os
+import hashlib
 import logging
 import streamlit as st
 
 from utils import get_fused_embedding, generate_caption
-from chromadb import HttpClient
-from query_rephraser import QueryRephraser
-from caption_enhancer import CaptionEnhancer
-from intent_classifier import IntentClassifier, INTENT_FALLBACK_QUERIES
+from intent_classifier import INTENT_FALLBACK_QUERIES
+from lexical_index import reciprocal_rank_fusion
+from crop_router import build_where, keep_crops
+from llm_gateway import llm_gateway
+from resources import (
+    get_chroma,
+    get_rephraser,
+    get_caption_enhancer,
+    get_intent_classifier,
+    get_lexical_index,
+    get_crop_router,
+)
 
 # --- Setup Logging ---
 LOG_DIR = "app/logs"
@@ -23,35 +32,47 @@ logger = logging.getLogger(__name__)
 logger.info("🔧 Streamlit app started.")
 
 DISTANCE_THRESHOLD = 0.1  # adjust empirically
+LLM_SEARCH_BUDGET = 10.0  # seconds of LLM time allowed per search
+
+# Collection rows searched per query kind (see indexing.py)
+IMAGE_ROW_TYPES = ["image"]
+TEXT_ROW_TYPES = ["caption", "label", "sentence"]
+
 
 # --- Initialize Helpers ---
-rephraser = QueryRephraser()
-caption_enhancer = CaptionEnhancer()
-intent_classifier = IntentClassifier()
+# Cached across reruns and sessions; LLM stages share one gateway, so a
+# slow or failing Ollama degrades to raw text / BLIP captions instead of
+# stalling every session
+rephraser = get_rephraser()
+caption_enhancer = get_caption_enhancer()
+intent_classifier = get_intent_classifier()
 
 # --- Initialize ChromaDB ---
-try:
-    chroma_client = HttpClient(host="chromadb", port=8000)
-    collection = chroma_client.get_or_create_collection(
-        name="pest_disease",
-        metadata={"hnsw:space": "cosine"},
-    )
-    logger.info("✅ ChromaDB initialized.")
-    logger.info(f"✅ Chroma collection count: {collection.count()}")
-
-    test_result = collection.peek()
-    if not test_result["ids"]:
-        logger.warning("⚠️ No data found in ChromaDB collection.")
-        st.warning(
-            "⚠️ No image data indexed yet. Please run the indexing script."
-        )
-        st.stop()
-    else:
-        logger.info(f"📦 ChromaDB contains {len(test_result['ids'])} items.")
+# Client, collection handle and count are cached and kept fresh by a
+# background health check, so reruns cost no ChromaDB round trips
+chroma = get_chroma()
+if not chroma.healthy:
+    # Don't wait for the next health check before retrying
+    chroma.refresh()
+if not chroma.healthy:
+    logger.error("❌ Failed to initialize ChromaDB.")
+    st.error("❌ Failed to initialize ChromaDB.")
+    st.stop()
 
+if not chroma.count:
+    logger.warning("⚠️ No data found in ChromaDB collection.")
+    st.warning("⚠️ No image data indexed yet. Please run the indexing script.")
+    st.stop()
+
+collection = chroma.collection
+
+try:
+    # --- Lexical (BM25) index over captions and labels ---
+    lexical_index = get_lexical_index(collection)
+    crop_router = get_crop_router(collection)
 except Exception as e:
-    logger.exception(f"❌ Failed to initialize ChromaDB: {e}")
-    st.error("❌ Failed to initialize ChromaDB.")
+    logger.exception(f"❌ Failed to load lexical index: {e}")
+    st.error("❌ Failed to load lexical index.")
     st.stop()
 
 
@@ -72,6 +93,8 @@ def render_results(
             caption = metadata.get("caption", "-")
             path = metadata.get("path", "N/A")
             distance = distances[i]
+            # Lexical-only matches carry no vector distance
+            distance_text = f"{distance:.3f}" if distance is not None else "-"
 
             try:
                 with col1:
@@ -82,7 +105,7 @@ def render_results(
                 with col2:
                     st.markdown(f"**Label:** {label}")
                     st.markdown(f"**Caption:** {caption}")
-                    st.markdown(f"**Distance:** `{distance:.3f}`")
+                    st.markdown(f"**Distance:** `{distance_text}`")
             except Exception as img_err:
                 st.warning(f"⚠️ Unable to display result: {path}")
                 logger.warning(
@@ -93,6 +116,37 @@ def render_results(
         logger.info("🔍 No matching metadata found in results.")
 
 
+def search_key(uploaded_file, text_query):
+    """
+    Identify a search by its inputs, to memoize its outcome per session.
+    """
+    image_hash = (
+        hashlib.md5(uploaded_file.getvalue()).hexdigest()
+        if uploaded_file
+        else None
+    )
+    return (image_hash, text_query or None)
+
+
+def show_search(outcome):
+    """
+    Render a search outcome and remember it in the session, so reruns
+    with the same inputs (without pressing Search) replay it without any
+    backend or LLM calls.
+    """
+    st.session_state["last_search"] = outcome
+    if outcome.get("info"):
+        st.info(outcome["info"])
+    if outcome.get("warning"):
+        st.warning(outcome["warning"])
+        return
+    render_results(
+        outcome["results"],
+        outcome["results"]["distances"][0],
+        title=outcome["title"],
+    )
+
+
 # --- Streamlit UI ---
 st.title("🌿 Multimodal RAG: Image + Text Pest & Disease Search")
 st.write(
@@ -117,9 +171,28 @@ search_button = st.button(
 
 query_embedding = None
 query_type = None
+lexical_query = None
+crops = set()
+
+current_key = search_key(uploaded_file, text_query)
+last_search = st.session_state.get("last_search")
+
+if (
+    not search_button
+    and last_search
+    and last_search["key"] == current_key
+):
+    # Rerun from another widget with the same inputs: replay the last
+    # search instead of recomputing. Pressing Search always recomputes, so
+    # a result from a degraded LLM or a no-match warning can be refreshed
+    logger.info("♻️ Replaying memoized search results.")
+    show_search(last_search)
+    st.stop()
 
 if search_button and (uploaded_file or text_query):
-    with st.spinner("🔍 Processing your query..."):
+    with st.spinner("🔍 Processing your query..."), llm_gateway.budget(
+        LLM_SEARCH_BUDGET
+    ):
         try:
             image_caption = None
             if uploaded_file:
@@ -127,7 +200,22 @@ if search_button and (uploaded_file or text_query):
                 image_caption = caption_enhancer.enhance(blip_image_caption)
                 logger.info(f"🔄 Image caption: '{image_caption}'")
 
-            if text_query:
+            user_text = text_query
+
+            # 🔤 Text-only queries naming a known label are already precise:
+            # skip the rephrase and the intent fallback to generic examples
+            matched_label = (
+                lexical_index.match_label(text_query)
+                if text_query and not uploaded_file
+                else None
+            )
+
+            if matched_label:
+                logger.info(
+                    f"🔤 Lexical label match '{matched_label}', "
+                    "skipping rephrase and intent."
+                )
+            elif text_query:
                 original = text_query
                 text_query = rephraser.rephrase(
                     user_input=text_query, image_caption=image_caption
@@ -135,14 +223,19 @@ if search_button and (uploaded_file or text_query):
                 logger.info(f"🔄 Rephrased: '{original}' → '{text_query}'")
 
             # 🔍 Intent detection
-            intent = intent_classifier.classify(text_query)
+            intent = None
+            if not matched_label:
+                intent = intent_classifier.classify(text_query)
             logger.info(f"🧠 Intent detected: {intent}")
 
+            # 🌱 Restrict the search to the crops the user named. Only the
+            # raw text is trusted: rephrases and captions may invent a crop
+            crops = crop_router.route(user_text)
+            if crops:
+                logger.info(f"🌱 Routed to crops: {sorted(crops)}")
+
             # 📥 Fallback if user asks for disease info without uploading image
             if not uploaded_file and intent in INTENT_FALLBACK_QUERIES:
-                st.info(
-                    "🔍 No image uploaded. Showing some example disease cases."
-                )
                 fallback_query = INTENT_FALLBACK_QUERIES[intent]
                 with st.spinner("🔍 Searching related examples..."):
                     fallback_embedding = get_fused_embedding(
@@ -152,13 +245,21 @@ if search_button and (uploaded_file or text_query):
                     )
                     results = collection.query(
                         query_embeddings=[fallback_embedding],
+                        where=build_where(
+                            labels=crop_router.labels_for(crops),
+                            types=TEXT_ROW_TYPES,
+                        ),
                         n_results=10,
                         include=["distances", "metadatas"],
                     )
-                render_results(
-                    results,
-                    results["distances"][0],
-                    title="🦠 Example Disease Cases",
+                show_search(
+                    {
+                        "key": current_key,
+                        "info": "🔍 No image uploaded. "
+                        "Showing some example disease cases.",
+                        "results": results,
+                        "title": "🦠 Example Disease Cases",
+                    }
                 )
                 st.stop()
 
@@ -174,6 +275,7 @@ if search_button and (uploaded_file or text_query):
                 else "image" if uploaded_file else "text"
             )
             DISTANCE_THRESHOLD = 0.1 if uploaded_file else 0.2
+            lexical_query = text_query
             logger.info(f"🧠 Running {query_type} query.")
 
         except Exception as e:
@@ -183,25 +285,65 @@ if search_button and (uploaded_file or text_query):
 
 if query_embedding is not None:
     try:
+        # Image-only queries compare against image rows, text-only queries
+        # against text rows; fused queries search every row type
+        row_types = {"image": IMAGE_ROW_TYPES, "text": TEXT_ROW_TYPES}.get(
+            query_type
+        )
+        where = build_where(
+            labels=crop_router.labels_for(crops), types=row_types
+        )
+
         with st.spinner("🔍 Searching similar cases..."):
             results = collection.query(
                 query_embeddings=[query_embedding],
+                where=where,
                 n_results=10,
                 include=["distances", "metadatas"],
             )
         logger.info(f"✅ Query returned {len(results['ids'][0])} results.")
-        distances = results["distances"][0]
-        logger.info(f"All distances: {distances}")
+
+        # 🌱 Image-only queries are routed by the majority crop of their
+        # nearest images, keeping only that crop's hits (no second query)
+        if query_type == "image" and not crops:
+            crops = crop_router.route_hits(results["metadatas"][0])
+            if crops:
+                logger.info(f"🌱 Image routed to crops: {sorted(crops)}")
+                results = keep_crops(results, crops)
+
+        # The closeness gate only trusts real vector distances
+        vector_distances = results["distances"][0]
+
+        # 🔤 Fuse vector results with BM25 hits over captions and labels
+        if lexical_query:
+            lexical_hits = lexical_index.search(
+                lexical_query, n_results=10, crops=crops
+            )
+            logger.info(f"🔤 Lexical search returned {len(lexical_hits)} hits.")
+            results = reciprocal_rank_fusion(
+                results, lexical_hits, n_results=10
+            )
+        logger.info(f"All distances: {results['distances'][0]}")
     except Exception as e:
         logger.exception(f"❌ Query to ChromaDB failed: {e}")
         st.error("❌ ChromaDB query failed.")
         st.stop()
 
-    if all(d > DISTANCE_THRESHOLD for d in distances):
-        st.warning(
-            "⚠️ No close matches found. Try a more specific query or different image."
+    if all(d > DISTANCE_THRESHOLD for d in vector_distances):
+        logger.info(f"❌ All distances above threshold: {vector_distances}")
+        show_search(
+            {
+                "key": current_key,
+                "warning": "⚠️ No close matches found. "
+                "Try a more specific query or different image.",
+            }
         )
-        logger.info(f"❌ All distances above threshold: {distances}")
         st.stop()
 
-    render_results(results, distances)
+    show_search(
+        {
+            "key": current_key,
+            "results": results,
+            "title": "🔎 Top Similar Results",
+        }
+    )
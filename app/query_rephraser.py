@@ -10,11 +10,16 @@ class QueryRephraser:
     suitable for a vector search (e.g., ChromaDB).
     """
 
-    def __init__(self, llm=None):
+    def __init__(self, llm=None, gateway=None):
         # Initialize the LLM
         # (defaults to a local Ollama instance using the 'mistral' model)
         self.llm = llm or ChatOllama(
-            model="mistral", base_url="http://host.docker.internal:11434"
+            model="mistral",
+            base_url="http://host.docker.internal:11434",
+            # HTTP timeout matching the gateway deadline
+            client_kwargs=(
+                {"timeout": gateway.call_timeout} if gateway else {}
+            ),
         )  # You can override with any compatible LangChain LLM
 
         # Prompt when caption is available
@@ -63,6 +68,9 @@ class QueryRephraser:
             | RunnableLambda(lambda x: x.content)
         )
 
+        # Optional LLMGateway; without one the LLM is called directly
+        self.gateway = gateway
+
     def rephrase(self, user_input: str, image_caption: str = None) -> str:
         """
         Rephrase a user-friendly question into a clean search query
@@ -75,11 +83,18 @@ class QueryRephraser:
 
         Returns:
             str: Rephrased search-ready query
-            (e.g., "gumosis disease symptoms in plants")
+            (e.g., "gumosis disease symptoms in plants"), or the original
+            input if the gateway skips the LLM call
         """
         if image_caption:
-            return self.chain_with_caption.invoke(
-                {"input": user_input, "caption": image_caption}
-            )
+            chain = self.chain_with_caption
+            inputs = {"input": user_input, "caption": image_caption}
         else:
-            return self.chain_text_only.invoke({"input": user_input})
+            chain = self.chain_text_only
+            inputs = {"input": user_input}
+
+        if self.gateway is None:
+            return chain.invoke(inputs)
+        return self.gateway.call(
+            "rephrase", lambda: chain.invoke(inputs), fallback=user_input
+        )
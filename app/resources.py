@@ -0,0 +1,170 @@
+import os
+import logging
+import threading
+import streamlit as st
+
+from chromadb import HttpClient
+from query_rephraser import QueryRephraser
+from caption_enhancer import CaptionEnhancer
+from intent_classifier import IntentClassifier
+from lexical_index import BM25Index, LEXICAL_INDEX_PATH
+from crop_router import CropRouter
+from llm_gateway import llm_gateway
+
+# --- Setup Logging ---
+logger = logging.getLogger(__name__)
+
+CHROMA_HOST = "chromadb"
+CHROMA_PORT = 8000
+COLLECTION_NAME = "pest_disease"
+HEALTH_CHECK_INTERVAL = 30.0  # seconds between background heartbeats
+
+
+class ChromaResource:
+    """
+    A process-wide ChromaDB handle shared by every Streamlit session.
+
+    The HTTP client (and its keep-alive connection pool) and the collection
+    handle are created once. A daemon thread heartbeats the server every
+    `interval` seconds and refreshes the cached item count, so page
+    reruns read `healthy` and `count` without any backend calls.
+
+    Only one watcher runs per process: creating a new resource (after a
+    code reload or cache clear) stops the watchers of older ones.
+    """
+
+    WATCHER_NAME = "chroma-health"
+
+    def __init__(
+        self,
+        host: str = CHROMA_HOST,
+        port: int = CHROMA_PORT,
+        interval: float = HEALTH_CHECK_INTERVAL,
+    ):
+        self.host = host
+        self.port = port
+        self.interval = interval
+        self.client = None
+        self.collection = None
+        self.count = 0
+        self.healthy = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+        self.refresh()
+        stop_watchers()
+        watcher = threading.Thread(
+            target=self._watch, name=self.WATCHER_NAME, daemon=True
+        )
+        watcher.stop_event = self._stop
+        watcher.start()
+
+    def close(self):
+        """
+        Stop the background health check.
+        """
+        self._stop.set()
+
+    def refresh(self):
+        """
+        (Re)connect if needed, then re-fetch the collection handle and count.
+        """
+        with self._lock:
+            self._connect()
+
+    def _connect(self):
+        # Caller holds self._lock, so only one HttpClient is ever created
+        try:
+            client = self.client or HttpClient(host=self.host, port=self.port)
+            collection = client.get_or_create_collection(
+                name=COLLECTION_NAME,
+                metadata={"hnsw:space": "cosine"},
+            )
+            count = collection.count()
+        except Exception as e:
+            if self.healthy:
+                logger.warning(f"⚠️ ChromaDB health check failed: {e}")
+            self.healthy = False
+            return
+
+        if not self.healthy:
+            logger.info(f"✅ ChromaDB connected ({count} items).")
+        self.client = client
+        self.collection = collection
+        self.count = count
+        self.healthy = True
+
+    def _check(self):
+        with self._lock:
+            try:
+                self.client.heartbeat()
+                self.count = self.collection.count()
+                self.healthy = True
+            except Exception:
+                # Connection or collection gone: rebuild both
+                self._connect()
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            self._check()
+
+
+def stop_watchers():
+    """
+    Stop every ChromaDB health-check thread in this process, including
+    those left behind by resources from a previous module reload.
+    """
+    for thread in threading.enumerate():
+        if thread.name == ChromaResource.WATCHER_NAME:
+            stop_event = getattr(thread, "stop_event", None)
+            if stop_event is not None:
+                stop_event.set()
+
+
+@st.cache_resource
+def get_chroma() -> ChromaResource:
+    return ChromaResource()
+
+
+@st.cache_resource
+def get_rephraser() -> QueryRephraser:
+    return QueryRephraser(gateway=llm_gateway)
+
+
+@st.cache_resource
+def get_caption_enhancer() -> CaptionEnhancer:
+    return CaptionEnhancer(gateway=llm_gateway)
+
+
+@st.cache_resource
+def get_intent_classifier() -> IntentClassifier:
+    return IntentClassifier(gateway=llm_gateway)
+
+
+@st.cache_resource(max_entries=1)
+def _load_lexical_index(_collection, mtime: float) -> tuple:
+    index = BM25Index.load_or_rebuild(_collection)
+    # The router only depends on the label set, so it is built with the index
+    return index, CropRouter(index.labels())
+
+
+def _lexical_index_mtime() -> float:
+    try:
+        return os.path.getmtime(LEXICAL_INDEX_PATH)
+    except OSError:
+        return 0.0
+
+
+def get_lexical_index(collection) -> BM25Index:
+    """
+    Return the cached BM25 index, reloading it only when indexing has
+    rewritten the file on disk.
+    """
+    return _load_lexical_index(collection, _lexical_index_mtime())[0]
+
+
+def get_crop_router(collection) -> CropRouter:
+    """
+    Return the crop router built from the cached BM25 index's labels.
+    """
+    return _load_lexical_index(collection, _lexical_index_mtime())[1]